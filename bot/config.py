@@ -21,7 +21,19 @@ INSTAGRAM_PASSWORD = os.getenv('INSTAGRAM_PASSWORD', 'YOUR_INSTAGRAM_PASSWORD')
 DOWNLOAD_DIRECTORY = os.getenv('DOWNLOAD_DIRECTORY', 'downloads/')
 HIGH_QUALITY = os.getenv('HIGH_QUALITY', 'True').lower() == 'true'
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))
-MAX_DOWNLOAD_SIZE = 50 * 1024 * 1024  # 50MB - Telegram bot API limit
+
+# Shared HTTP client settings (bot/utils/http.py)
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '15'))
+HTTP_MAX_CONCURRENCY_PER_HOST = int(os.getenv('HTTP_MAX_CONCURRENCY_PER_HOST', '8'))  # requests in flight per host
+HTTP_BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+HTTP_BACKOFF_MAX = 10  # seconds
+
+# Self-hosted Telegram Bot API server (https://github.com/tdlib/telegram-bot-api), e.g.
+# http://localhost:8081. In this mode files up to 2GB can be sent and finished downloads
+# are handed to the server by local path, so it must share the download directory.
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL', '').rstrip('/')
+LOCAL_BOT_API = bool(BOT_API_BASE_URL)
+MAX_DOWNLOAD_SIZE = (2000 if LOCAL_BOT_API else 50) * 1024 * 1024  # Telegram bot API upload limit
 
 # Spotify download settings
 SPOTIFY_QUALITY = 320  # kbps
@@ -31,4 +43,56 @@ YOUTUBE_QUALITY = 'best'  # Options: best, 1080p, 720p, etc.
 
 # User rate limiting (to prevent abuse)
 MAX_DOWNLOADS_PER_DAY = 50
-MAX_DOWNLOADS_PER_HOUR = 10
\ No newline at end of file
+MAX_DOWNLOADS_PER_HOUR = 10
+
+# Deployment mode: 'standalone' runs downloads inside the bot process, 'frontend' only
+# parses updates and enqueues jobs for worker processes started with `python worker.py`
+BOT_MODE = os.getenv('BOT_MODE', 'standalone').lower()
+
+# Job broker shared by the front-end and the workers ('sqlite'; 'memory' is single-process, for tests)
+BROKER_BACKEND = os.getenv('BROKER_BACKEND', 'sqlite').lower()
+BROKER_DB_PATH = os.getenv('BROKER_DB_PATH', 'data/jobs.db')
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '60'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+# Worker settings
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '2'))
+WORKER_POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', '1.0'))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', '2'))
+
+# spotdl/yt-dlp processes allowed to run at once in one process (updates are handled
+# concurrently so Cancel works mid-download; extra downloads wait for a slot)
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', str(WORKER_CONCURRENCY)))
+
+# Seconds to let in-flight downloads finish after SIGTERM before they are interrupted
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', '25'))
+
+# Telegram file_id cache, so tracks we already uploaded are re-sent without downloading
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', 'data/cache.db')
+
+# Seconds Telegram may cache inline query answers on its servers
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '30'))
+
+# Request tracing: traces slower than TRACE_SLOW_THRESHOLD seconds (0 disables) are written
+# to a rotating JSONL slow log; set TRACE_EXPORT_PATH to also write every trace to a local file
+TRACE_SLOW_THRESHOLD = float(os.getenv('TRACE_SLOW_THRESHOLD', '60'))
+TRACE_SLOW_LOG = os.getenv('TRACE_SLOW_LOG', 'data/slow_traces.jsonl')
+TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', '')
+TRACE_LOG_MAX_BYTES = 5 * 1024 * 1024
+TRACE_LOG_BACKUPS = 3
+
+# Off-peak cache warmer: pre-downloads popular tracks and uploads them to a private storage
+# chat to harvest file_ids. Enable it in one process only (the standalone bot or one worker).
+CACHE_WARMER = os.getenv('CACHE_WARMER', 'false').lower() == 'true'
+WARM_STORAGE_CHAT_ID = os.getenv('WARM_STORAGE_CHAT_ID', '')
+WARM_PLAYLISTS = [playlist.strip() for playlist in os.getenv('WARM_PLAYLISTS', '').split(',') if playlist.strip()]
+WARM_HOURS = os.getenv('WARM_HOURS', '2-7')  # local hours when warming may run, e.g. 22-6
+PEAK_HOURS = os.getenv('PEAK_HOURS', '17-23')  # local hours counted as peak in the warm report
+WARM_INTERVAL = int(os.getenv('WARM_INTERVAL', '600'))  # seconds between warm runs
+WARM_HISTORY_DAYS = int(os.getenv('WARM_HISTORY_DAYS', '14'))
+WARM_MAX_TRACKS_PER_RUN = int(os.getenv('WARM_MAX_TRACKS_PER_RUN', '25'))
+WARM_MAX_MB_PER_RUN = int(os.getenv('WARM_MAX_MB_PER_RUN', '250'))
+WARM_RETRY_FAILED_DAYS = int(os.getenv('WARM_RETRY_FAILED_DAYS', '3'))  # days before a failed track is tried again
+
+# Telegram user ids allowed to use admin commands such as /cachestats
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip()}
\ No newline at end of file
@@ -1,20 +1,21 @@
 import re
 import os
-import glob
-import subprocess
-import requests
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import shutil
+import asyncio
+from telegram import (Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle,
+                      InlineQueryResultCachedAudio, InputTextMessageContent)
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest, TimedOut
-from spotipy.oauth2 import SpotifyClientCredentials
-import spotipy
-from bot.config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET
-
-# Initialize Spotify client
-sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-    client_id=SPOTIFY_CLIENT_ID,
-    client_secret=SPOTIFY_CLIENT_SECRET
-))
+from bot.config import BOT_MODE, INLINE_CACHE_TIME, LOCAL_BOT_API, MAX_DOWNLOAD_SIZE
+from bot.utils.botapi import upload_file
+from bot.utils.broker import enqueue_job
+from bot.utils.clients import get_spotify_client
+from bot.utils.downloader import fetch_track_audio
+from bot.utils.file_cache import get_file_cache
+from bot.utils.http import get_bytes
+from bot.utils.jobs import JobFailed, cancel_markup, cancel_notice, new_job_dir, new_job_id, track_job
+from bot.utils.startup import has_tool
+from bot.utils.tracing import log, span
 
 def extract_spotify_id(url):
     """Extract Spotify ID and type from URL."""
@@ -50,20 +51,25 @@ async def handle_spotify_url(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     if content_type == 'track':
-        await download_single_track(update.message, spotify_id)
+        await start_track_download(update.message, spotify_id, update.effective_user.id)
     elif content_type == 'album':
         await update.message.reply_text("Album downloads are not supported. Please send individual track links.")
     elif content_type == 'playlist':
         await update.message.reply_text("Playlist downloads are not supported. Please send individual track links.")
 
+def search_spotify_tracks(query, limit=5):
+    """Return the Spotify track objects matching a search query."""
+    track_results = get_spotify_client().search(q=query, type='track', limit=limit)
+    return track_results['tracks']['items']
+
 async def search_spotify(update: Update, context: ContextTypes.DEFAULT_TYPE, query: str) -> None:
     """Search for tracks and albums on Spotify."""
     await update.message.reply_text(f"🔍 Searching Spotify for: *{query}*", parse_mode='Markdown')
     
     try:
         # Search for tracks
-        track_results = sp.search(q=query, type='track', limit=5)
-        tracks = track_results['tracks']['items']
+        with span('metadata lookup', backend='spotify', query=query):
+            tracks = await asyncio.to_thread(search_spotify_tracks, query)
         
         if not tracks:
             await update.message.reply_text(f"❌ No results found for: *{query}*", parse_mode='Markdown')
@@ -113,22 +119,157 @@ async def handle_spotify_callback(update: Update, context: ContextTypes.DEFAULT_
                 await query.message.reply_text(f"Starting track download...")
             
             # Get track info
-            track = sp.track(track_id)
+            track = await asyncio.to_thread(get_spotify_client().track, track_id)
             track_name = track['name']
             artists = ', '.join([artist['name'] for artist in track['artists']])
             
             # Send a direct message instead of trying to edit the callback message
             await query.message.reply_text(f"🎵 Downloading: *{track_name}* by *{artists}*", parse_mode='Markdown')
-            await download_single_track(query.message, track_id)
+            await start_track_download(query.message, track_id, query.from_user.id)
     except Exception as e:
         # If any error occurs, send a new message
         await query.message.reply_text(f"❌ Error processing request: {str(e)}")
 
-async def download_single_track(update, track_id):
-    """Download a single Spotify track using spotdl and send to user with metadata and cover."""
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answer `@bot song name` inline queries from the file_id cache.
+
+    Tracks we already uploaded are offered as cached audio, so sharing them costs
+    no download at all; the rest link to a download in the private chat.
+    """
+    inline_query = update.inline_query
+    text = inline_query.query.strip()
+    if not text:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME)
+        return
+    
+    try:
+        with span('metadata lookup', backend='spotify', query=text) as search:
+            tracks = await asyncio.to_thread(search_spotify_tracks, text)
+            search.set(results=len(tracks))
+    except Exception as e:
+        log(f"Inline search error: {e}")
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME)
+        return
+    
+    with span('cache lookup') as lookup:
+        cached = await asyncio.to_thread(
+            get_file_cache().get_many, [f"spotify:{track['id']}" for track in tracks]
+        )
+        lookup.set(hits=len(cached), misses=len(tracks) - len(cached))
+    results = []
+    for track in tracks:
+        track_name = track['name']
+        artists = ', '.join([artist['name'] for artist in track['artists']])
+        entry = cached.get(f"spotify:{track['id']}")
+        if entry:
+            results.append(InlineQueryResultCachedAudio(
+                id=f"cached_{track['id']}",
+                audio_file_id=entry['file_id'],
+                caption=entry['caption']
+            ))
+        else:
+            download_url = f"https://t.me/{context.bot.username}?start=track_{track['id']}"
+            results.append(InlineQueryResultArticle(
+                id=f"track_{track['id']}",
+                title=f"{track_name} - {artists}",
+                description="Not downloaded yet. Tap to download in private chat",
+                input_message_content=InputTextMessageContent(
+                    f"🎵 {track_name} by {artists}\nhttps://open.spotify.com/track/{track['id']}"
+                ),
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬇️ Download", url=download_url)]])
+            ))
+    
+    # Results depend only on the query, so Telegram may share them between users
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False)
+
+async def handle_chosen_inline_result(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Record the inline result a user sent, so inline demand feeds the request history."""
+    # Result ids are cached_<id> for cached audio and track_<id> for download links
+    kind, _, track_id = update.chosen_inline_result.result_id.partition('_')
+    await record_track_request(track_id, kind == 'cached')
+
+async def record_track_request(track_id, cache_hit):
+    """Add a request to the history the cache warmer learns what is popular from."""
+    await asyncio.to_thread(get_file_cache().record_request, f"spotify:{track_id}", cache_hit)
+
+async def start_track_download(message, track_id, user_id):
+    """Send a track, from the file_id cache if possible, otherwise by downloading it.
+
+    user_id is the user who asked for it (for button presses, not the message's
+    sender), who alone may cancel the download.
+    """
+    if await send_cached_track(message, track_id):
+        await record_track_request(track_id, True)
+        return
+    # Misses are recorded by the download once Spotify knows the track, so bad ids
+    # never reach the request history
+    if BOT_MODE == 'frontend':
+        await enqueue_job(message, 'spotify_track', user_id=user_id, track_id=track_id)
+    else:
+        try:
+            await download_single_track(message, track_id, user_id=user_id)
+        except JobFailed:
+            # The job has already told the user what went wrong
+            pass
+
+async def send_cached_track(message, track_id):
+    """Re-send a track we uploaded before by its file_id. Returns False on a cache miss."""
+    cache = get_file_cache()
+    content_key = f"spotify:{track_id}"
+    with span('cache lookup', key=content_key) as lookup:
+        entry = await asyncio.to_thread(cache.get, content_key)
+        lookup.set(hit=entry is not None)
+    if not entry:
+        return False
+    try:
+        with span('upload', mode='file_id', cache_hit=True):
+            await message.reply_audio(
+                audio=entry['file_id'],
+                title=entry['title'],
+                performer=entry['performer'],
+                caption=entry['caption']
+            )
+    except BadRequest as e:
+        # The file_id is no longer valid, so forget it and download again
+        log(f"Cached file_id for {content_key} rejected: {e}")
+        await asyncio.to_thread(cache.delete, content_key)
+        return False
+    return True
+
+async def download_single_track(update, track_id, job_id=None, user_id=None):
+    """Download a single Spotify track using spotdl and send to user with metadata and cover.
+
+    The download runs as a cancellable job; cancelling it kills spotdl and removes
+    any partially downloaded files. Raises JobFailed after telling the user about
+    a failure, so a worker marks the job failed instead of done.
+    """
+    job_id = job_id or new_job_id()
+    # A worker may pick up a job for a track that another job uploaded meanwhile
+    if await send_cached_track(update, track_id):
+        await record_track_request(track_id, True)
+        return
+    with track_job(job_id, user_id):
+        await _download_single_track(update, track_id, job_id)
+
+async def _fail(update, status_message, text, reply_markup=None):
+    """Replace the status message (and its Cancel button) with a failure and raise JobFailed."""
+    try:
+        if status_message:
+            await status_message.edit_text(text, reply_markup=reply_markup)
+        else:
+            await update.reply_text(text, reply_markup=reply_markup)
+    except (BadRequest, TimedOut) as e:
+        log("Could not report the failure to the user:", e)
+    raise JobFailed(text)
+
+async def _download_single_track(update, track_id, job_id):
+    job_dir = None
+    status_message = None
     try:
         # Get track info
-        track = sp.track(track_id)
+        with span('metadata lookup', backend='spotify', track_id=track_id):
+            track = await asyncio.to_thread(get_spotify_client().track, track_id)
+        await record_track_request(track_id, False)
         track_name = track['name']
         artists = ', '.join([artist['name'] for artist in track['artists']])
         album_name = track['album']['name']
@@ -141,79 +282,77 @@ async def download_single_track(update, track_id):
         fallback_markup = InlineKeyboardMarkup(keyboard)
 
         # Notify user
-        status_message = await update.reply_text(f"🎵 Downloading: *{track_name}* by *{artists}*", parse_mode='Markdown')
+        status_message = await update.reply_text(
+            f"🎵 Downloading: *{track_name}* by *{artists}*",
+            parse_mode='Markdown',
+            reply_markup=cancel_markup(job_id)
+        )
 
-        # Download with spotdl
-        DOWNLOAD_DIRECTORY = os.environ.get("DOWNLOAD_DIRECTORY", "/tmp")
-        url = f"https://open.spotify.com/track/{track_id}"
+        # Download with spotdl into a directory of its own
+        job_dir = new_job_dir('spotify_')
         
-        # Check if ffmpeg is installed
-        try:
-            ffmpeg_check = subprocess.run(['ffmpeg', '-version'], shell=True, capture_output=True, text=True)
-            if ffmpeg_check.returncode != 0:
-                await update.reply_text("❌ FFmpeg is not installed. Please install FFmpeg to download tracks.")
-                return
-        except Exception:
-            await update.reply_text("❌ FFmpeg is not installed. Please install FFmpeg to download tracks.")
-            return
+        # Check if ffmpeg is installed (probed once at startup)
+        if not await has_tool('ffmpeg'):
+            await _fail(update, status_message, "❌ FFmpeg is not installed. Please install FFmpeg to download tracks.")
             
-        cmd = f'spotdl --output "{DOWNLOAD_DIRECTORY}" "{url}"'
-        print("Running command:", cmd)
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        print("spotdl stdout:", result.stdout)
-        print("spotdl stderr:", result.stderr)
-
-        # Find the newest mp3 file
-        mp3_files = glob.glob(os.path.join(DOWNLOAD_DIRECTORY, "*.mp3"))
-        if not mp3_files:
-            print("No mp3 files found in", DOWNLOAD_DIRECTORY)
-            await update.reply_text(
+        latest_file = await fetch_track_audio(track, job_dir)
+        if not latest_file:
+            await _fail(
+                update, status_message,
                 f"❌ Error downloading track. You can try finding it on YouTube:",
                 reply_markup=fallback_markup
             )
-            return
 
-        latest_file = max(mp3_files, key=os.path.getctime)
         file_size = os.path.getsize(latest_file)
-        print("Downloaded file:", latest_file, "Size:", file_size)
+        log("Downloaded file:", latest_file, "Size:", file_size)
 
         if file_size == 0:
-            await update.reply_text(
+            await _fail(
+                update, status_message,
                 f"❌ Downloaded file is empty. You can try finding it on YouTube:",
                 reply_markup=fallback_markup
             )
-            os.remove(latest_file)
-            return
 
-        if file_size > 50 * 1024 * 1024:
-            await update.reply_text("❌ The downloaded file is too large for Telegram (max 50MB).")
-            os.remove(latest_file)
-            return
+        if file_size > MAX_DOWNLOAD_SIZE:
+            await _fail(
+                update, status_message,
+                f"❌ The downloaded file is too large for Telegram (max {MAX_DOWNLOAD_SIZE // (1024 * 1024)}MB)."
+            )
 
         # Download cover art if available
         thumb_path = None
         if cover_url:
             try:
-                thumb_path = os.path.join(DOWNLOAD_DIRECTORY, "cover.jpg")
+                with span('cover art') as cover_span:
+                    cover = await get_bytes(cover_url)
+                    cover_span.set(bytes=len(cover))
+                thumb_path = os.path.join(job_dir, "cover.jpg")
                 with open(thumb_path, "wb") as img_file:
-                    img_file.write(requests.get(cover_url).content)
+                    img_file.write(cover)
             except Exception as e:
-                print("Error downloading cover art:", e)
+                log("Error downloading cover art:", e)
                 thumb_path = None
 
         # Send audio with metadata and cover
         try:
-            with open(latest_file, 'rb') as audio_file:
-                await update.reply_audio(
+            with span('upload', mode='path' if LOCAL_BOT_API else 'stream', bytes=file_size), \
+                    upload_file(latest_file) as audio_file:
+                sent = await update.reply_audio(
                     audio=audio_file,
                     title=track_name,
                     performer=artists,
                     caption=f"Album: {album_name}",
-                    thumb=thumb_path if thumb_path and os.path.exists(thumb_path) else None
+                    thumbnail=thumb_path if thumb_path and os.path.exists(thumb_path) else None
+                )
+            # Remember the file_id so the next request (or inline query) needs no download
+            if sent.audio:
+                await asyncio.to_thread(
+                    get_file_cache().put, f"spotify:{track_id}", sent.audio.file_id,
+                    track_name, artists, f"Album: {album_name}"
                 )
         except Exception as send_error:
-            print("Error sending audio:", send_error)
-            await update.reply_text("❌ Error sending audio file.")
+            log("Error sending audio:", send_error)
+            await _fail(update, status_message, "❌ Error sending audio file.")
 
         # Clean up
         os.remove(latest_file)
@@ -222,6 +361,20 @@ async def download_single_track(update, track_id):
 
         await status_message.edit_text(f"✅ Sent: *{track_name}* by *{artists}*", parse_mode='Markdown')
 
+    except asyncio.CancelledError:
+        notice = cancel_notice(job_id)
+        log(f"Job {job_id} cancelled")
+        if notice and status_message:
+            try:
+                await status_message.edit_text(notice)
+            except Exception:
+                pass
+        raise
+    except JobFailed:
+        raise
     except Exception as e:
-        print("General error:", e)
-        await update.reply_text(f"❌ Error processing track: {str(e)}")
\ No newline at end of file
+        log("General error:", e)
+        await _fail(update, status_message, f"❌ Error processing track: {str(e)}")
+    finally:
+        if job_dir:
+            shutil.rmtree(job_dir, ignore_errors=True)
\ No newline at end of file
@@ -2,11 +2,11 @@ import re
 import os
 from telegram import Update
 from telegram.ext import ContextTypes
-import requests
 from bot.utils.downloader import ensure_directory_exists
 from bot.config import DOWNLOAD_DIRECTORY
+from bot.utils.http import request, resolve_redirects
 
-def extract_tiktok_id(url):
+async def extract_tiktok_id(url):
     """Extract TikTok video ID from URL."""
     # Try to match TikTok URL patterns
     match = re.search(r'tiktok\.com/[@a-zA-Z0-9_\.-]+/video/(\d+)', url)
@@ -18,8 +18,7 @@ def extract_tiktok_id(url):
     if match:
         # For shortened URLs, we need to follow the redirect
         try:
-            response = requests.head(url, allow_redirects=True)
-            final_url = response.url
+            final_url = await resolve_redirects(url)
             match = re.search(r'tiktok\.com/[@a-zA-Z0-9_\.-]+/video/(\d+)', final_url)
             if match:
                 return match.group(1)
@@ -28,7 +27,7 @@ def extract_tiktok_id(url):
     
     return None
 
-def get_tiktok_download_url(video_id):
+async def get_tiktok_download_url(video_id):
     """Get the download URL for a TikTok video using a third-party API."""
     # Note: This is a placeholder. In a real implementation, you would use a working TikTok downloader API
     # There are several services that offer this functionality, but they may require API keys
@@ -38,7 +37,7 @@ def get_tiktok_download_url(video_id):
     api_url = f"https://tiktok-downloader-api.example.com/video/{video_id}"
     
     try:
-        response = requests.get(api_url)
+        response = await request('GET', api_url)
         if response.status_code == 200:
             data = response.json()
             return data.get('download_url')
@@ -50,7 +49,7 @@ def get_tiktok_download_url(video_id):
 async def handle_tiktok_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle TikTok URLs."""
     url = update.message.text
-    video_id = extract_tiktok_id(url)
+    video_id = await extract_tiktok_id(url)
     
     if not video_id:
         await update.message.reply_text("Invalid TikTok URL. Please provide a valid TikTok video link.")
@@ -63,7 +62,7 @@ async def handle_tiktok_url(update: Update, context: ContextTypes.DEFAULT_TYPE)
         ensure_directory_exists(DOWNLOAD_DIRECTORY)
         
         # Get download URL (in a real implementation, this would use a working API)
-        download_url = get_tiktok_download_url(video_id)
+        download_url = await get_tiktok_download_url(video_id)
         
         if not download_url:
             # Fallback method for demonstration purposes
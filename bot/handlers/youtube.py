@@ -1,8 +1,17 @@
 import re
+import asyncio
 import os
 import glob
+import shutil
 from telegram import Update
 from telegram.ext import ContextTypes
+from bot.config import BOT_MODE, LOCAL_BOT_API, MAX_DOWNLOAD_SIZE
+from bot.utils.botapi import upload_file
+from bot.utils.broker import enqueue_job
+from bot.utils.downloader import choose_bitrate, max_filesize_arg
+from bot.utils.jobs import (JobFailed, cancel_markup, cancel_notice, new_job_dir, new_job_id, run_process,
+                            track_job)
+from bot.utils.tracing import log, span
 
 def extract_youtube_id(url):
     """Extract YouTube video ID from URL."""
@@ -20,18 +29,72 @@ def extract_youtube_id(url):
 
 async def handle_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
     url = update.message.text
-    DOWNLOAD_DIRECTORY = os.environ.get("DOWNLOAD_DIRECTORY", "/tmp")
-    # Use yt-dlp to download as mp3
-    output_path = os.path.join(DOWNLOAD_DIRECTORY, "%(title)s.%(ext)s")
-    cmd = f'yt-dlp -x --audio-format mp3 -o "{output_path}" "{url}"'
-    os.system(cmd)
-    # Find the newest mp3 file in the directory
-    mp3_files = glob.glob(os.path.join(DOWNLOAD_DIRECTORY, "*.mp3"))
-    if not mp3_files:
-        await update.message.reply_text("Download failed. No audio file found.")
-        return
-    latest_file = max(mp3_files, key=os.path.getctime)
-    print(f"Downloaded: {latest_file}, Size: {os.path.getsize(latest_file)} bytes")  # Debug print
-    with open(latest_file, "rb") as f:
-        await update.message.reply_audio(f, filename=os.path.basename(latest_file))
-    os.remove(latest_file)
\ No newline at end of file
+    if BOT_MODE == 'frontend':
+        await enqueue_job(update.message, 'youtube_audio', user_id=update.effective_user.id, url=url)
+    else:
+        try:
+            await download_youtube_audio(update.message, url, user_id=update.effective_user.id)
+        except JobFailed:
+            # The job has already told the user what went wrong
+            pass
+
+async def download_youtube_audio(message, url, job_id=None, user_id=None):
+    """Download a YouTube video as mp3 with yt-dlp and send it as a reply to message.
+
+    Raises JobFailed after telling the user about a failure.
+    """
+    job_id = job_id or new_job_id()
+    job_dir = new_job_dir('youtube_')
+    status_message = None
+    try:
+        with track_job(job_id, user_id):
+            status_message = await message.reply_text("🎬 Downloading audio...", reply_markup=cancel_markup(job_id))
+            # Use yt-dlp to download as mp3 (it transcodes with ffmpeg in the same process)
+            output_path = os.path.join(job_dir, "%(title)s.%(ext)s")
+            bitrate = choose_bitrate()
+            with span('download', backend='yt-dlp', bitrate=bitrate) as download:
+                returncode, _, _ = await run_process([
+                    'yt-dlp', '-x', '--audio-format', 'mp3',
+                    '--audio-quality', f"{bitrate}K",
+                    '--max-filesize', max_filesize_arg(),
+                    '-o', output_path, url
+                ])
+                download.set(returncode=returncode)
+            # Find the newest mp3 file in the directory
+            mp3_files = glob.glob(os.path.join(job_dir, "*.mp3"))
+            if not mp3_files:
+                await status_message.edit_text("Download failed. No audio file found.")
+                raise JobFailed("No audio file found")
+            latest_file = max(mp3_files, key=os.path.getctime)
+            file_size = os.path.getsize(latest_file)
+            download.set(bytes=file_size)
+            log(f"Downloaded: {latest_file}, Size: {file_size} bytes")  # Debug print
+            if file_size > MAX_DOWNLOAD_SIZE:
+                await status_message.edit_text(
+                    f"❌ The downloaded file is too large for Telegram (max {MAX_DOWNLOAD_SIZE // (1024 * 1024)}MB)."
+                )
+                raise JobFailed("Downloaded file too large")
+            with span('upload', mode='path' if LOCAL_BOT_API else 'stream', bytes=file_size), \
+                    upload_file(latest_file) as f:
+                await message.reply_audio(f, filename=os.path.basename(latest_file))
+            await status_message.edit_text("✅ Sent!")
+    except asyncio.CancelledError:
+        notice = cancel_notice(job_id)
+        if notice and status_message:
+            try:
+                await status_message.edit_text(notice)
+            except Exception:
+                pass
+        raise
+    except JobFailed:
+        raise
+    except Exception:
+        # Don't leave "Downloading..." with a Cancel button behind
+        if status_message:
+            try:
+                await status_message.edit_text("❌ Download failed.")
+            except Exception:
+                pass
+        raise
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
\ No newline at end of file
@@ -0,0 +1,35 @@
+from contextlib import contextmanager
+from pathlib import Path
+from bot.config import BOT_API_BASE_URL, LOCAL_BOT_API
+
+def bot_api_settings():
+    """Return the Bot/ApplicationBuilder settings for the configured Bot API server.
+
+    Empty when using the public api.telegram.org server.
+    """
+    if not LOCAL_BOT_API:
+        return {}
+    return {
+        "base_url": f"{BOT_API_BASE_URL}/bot",
+        "base_file_url": f"{BOT_API_BASE_URL}/file/bot",
+        "local_mode": True
+    }
+
+def configure_builder(builder):
+    """Point an ApplicationBuilder at the configured Bot API server."""
+    for name, value in bot_api_settings().items():
+        builder = getattr(builder, name)(value)
+    return builder
+
+@contextmanager
+def upload_file(path):
+    """Yield what to pass as the file argument of reply_audio() and friends.
+
+    A local Bot API server reads the file straight from disk, so it only gets the
+    path; otherwise the file is opened and uploaded through the HTTP client.
+    """
+    if LOCAL_BOT_API:
+        yield Path(path)
+    else:
+        with open(path, 'rb') as file:
+            yield file
\ No newline at end of file
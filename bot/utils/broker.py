@@ -0,0 +1,315 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing
+from bot.config import BROKER_BACKEND, BROKER_DB_PATH, JOB_MAX_ATTEMPTS
+from bot.utils.jobs import cancel_markup, new_job_id
+from bot.utils.tracing import current_trace_id, span
+
+class Broker(ABC):
+    """Job queue shared by the bot front-end and the download workers.
+
+    Jobs are dicts with 'id', 'kind', 'payload' and 'attempts'. A claimed job is
+    leased to one worker; if the lease is not renewed with heartbeat() before it
+    expires, the job is handed to the next worker that calls claim().
+    """
+
+    @abstractmethod
+    def enqueue(self, kind, payload, job_key):
+        """Add a job under a caller-chosen key (used for cancelling it) and return its id."""
+
+    @abstractmethod
+    def claim(self, worker_id, lease_seconds):
+        """Lease the oldest runnable job to a worker, or return None if there is none."""
+
+    @abstractmethod
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        """Extend a job's lease. Returns False if the worker no longer owns the job."""
+
+    @abstractmethod
+    def complete(self, job_id, worker_id):
+        """Mark a leased job as done."""
+
+    @abstractmethod
+    def fail(self, job_id, worker_id, error):
+        """Mark a leased job as failed."""
+
+    @abstractmethod
+    def release(self, job_id, worker_id):
+        """Hand a leased job back to the queue without counting it as an attempt."""
+
+    @abstractmethod
+    def request_cancel(self, job_key):
+        """Cancel a queued or running job. Returns False if it had already finished."""
+
+    @abstractmethod
+    def status(self, job_id):
+        """Return a job's status ('queued', 'running', 'done', 'failed' or 'cancelled')."""
+
+    @abstractmethod
+    def owner(self, job_key):
+        """Return the id of the user who requested a job, or None if unknown."""
+
+class SQLiteBroker(Broker):
+    """Broker backed by a SQLite database in WAL mode, shared by processes on one host."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " job_key TEXT UNIQUE,"
+                " kind TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'queued',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " worker_id TEXT,"
+                " lease_expires REAL,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _connect(self):
+        # Autocommit mode, so transactions are only the explicit BEGIN IMMEDIATE blocks
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return closing(conn)
+
+    def enqueue(self, kind, payload, job_key):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (job_key, kind, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_key, kind, json.dumps(payload), now, now)
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker_id, lease_seconds):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker stopped heartbeating and have no attempts left are given up on
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'lease expired', updated_at = ?"
+                    " WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, JOB_MAX_ATTEMPTS)
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued'"
+                    " OR (status = 'running' AND lease_expires < ?)"
+                    " ORDER BY id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires = ?,"
+                    " attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, now + lease_seconds, now, row['id'])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return {
+            "id": row['id'],
+            "kind": row['kind'],
+            "payload": json.loads(row['payload']),
+            "attempts": row['attempts'] + 1
+        }
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ?"
+                " WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + lease_seconds, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id):
+        self._finish(job_id, worker_id, 'done', None)
+
+    def fail(self, job_id, worker_id, error):
+        self._finish(job_id, worker_id, 'failed', error)
+
+    def release(self, job_id, worker_id):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, lease_expires = NULL,"
+                " attempts = attempts - 1, updated_at = ?"
+                " WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), job_id, worker_id)
+            )
+
+    def request_cancel(self, job_key):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', lease_expires = NULL, updated_at = ?"
+                " WHERE job_key = ? AND status IN ('queued', 'running')",
+                (time.time(), job_key)
+            )
+            return cursor.rowcount == 1
+
+    def status(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return row['status'] if row else None
+
+    def owner(self, job_key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload FROM jobs WHERE job_key = ?", (job_key,)).fetchone()
+        return json.loads(row['payload'])['params'].get('user_id') if row else None
+
+    def _finish(self, job_id, worker_id, status, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, updated_at = ?"
+                " WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (status, error, time.time(), job_id, worker_id)
+            )
+
+class MemoryBroker(Broker):
+    """In-process broker for tests; jobs are invisible to other processes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._next_id = 1
+
+    def enqueue(self, kind, payload, job_key):
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._jobs[job_id] = {
+                "id": job_id,
+                "job_key": job_key,
+                "kind": kind,
+                "payload": payload,
+                "status": 'queued',
+                "attempts": 0,
+                "worker_id": None,
+                "lease_expires": None,
+                "error": None
+            }
+            return job_id
+
+    def claim(self, worker_id, lease_seconds):
+        now = time.time()
+        with self._lock:
+            for job in self._jobs.values():
+                expired = job['status'] == 'running' and job['lease_expires'] < now
+                if expired and job['attempts'] >= JOB_MAX_ATTEMPTS:
+                    job.update(status='failed', error='lease expired')
+                    continue
+                if job['status'] == 'queued' or expired:
+                    job.update(status='running', worker_id=worker_id, lease_expires=now + lease_seconds)
+                    job['attempts'] += 1
+                    return {key: job[key] for key in ('id', 'kind', 'payload', 'attempts')}
+        return None
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job['worker_id'] != worker_id or job['status'] != 'running':
+                return False
+            job['lease_expires'] = time.time() + lease_seconds
+            return True
+
+    def complete(self, job_id, worker_id):
+        self._finish(job_id, worker_id, 'done', None)
+
+    def fail(self, job_id, worker_id, error):
+        self._finish(job_id, worker_id, 'failed', error)
+
+    def release(self, job_id, worker_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job['worker_id'] == worker_id and job['status'] == 'running':
+                job.update(status='queued', worker_id=None, lease_expires=None)
+                job['attempts'] -= 1
+
+    def request_cancel(self, job_key):
+        with self._lock:
+            for job in self._jobs.values():
+                if job['job_key'] == job_key and job['status'] in ('queued', 'running'):
+                    job.update(status='cancelled', lease_expires=None)
+                    return True
+        return False
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job['status'] if job else None
+
+    def owner(self, job_key):
+        with self._lock:
+            for job in self._jobs.values():
+                if job['job_key'] == job_key:
+                    return job['payload']['params'].get('user_id')
+        return None
+
+    def _finish(self, job_id, worker_id, status, error):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job['worker_id'] == worker_id and job['status'] == 'running':
+                job.update(status=status, error=error, lease_expires=None)
+
+_broker = None
+
+def check_shared_broker():
+    """Fail at startup if the broker can't be shared between a front-end and workers."""
+    if BROKER_BACKEND == 'memory':
+        raise ValueError(
+            "BROKER_BACKEND=memory keeps jobs inside one process, so a separate front-end and "
+            "workers can't share them; use BROKER_BACKEND=sqlite"
+        )
+
+def get_broker():
+    """Return the broker configured by BROKER_BACKEND, creating it on first use."""
+    global _broker
+    if _broker is None:
+        if BROKER_BACKEND == 'sqlite':
+            _broker = SQLiteBroker(BROKER_DB_PATH)
+        elif BROKER_BACKEND == 'memory':
+            _broker = MemoryBroker()
+        else:
+            raise ValueError(f"Unknown BROKER_BACKEND: {BROKER_BACKEND}")
+    return _broker
+
+async def enqueue_job(message, kind, user_id=None, **params):
+    """Queue a download job for the worker pool and tell the user it is queued.
+
+    The originating message is stored with the job so the worker can reply to it
+    and upload the result directly. The job key doubles as the worker's local job
+    id, so the Cancel button works before and after a worker picks the job up;
+    user_id is the requester, the only user allowed to press it.
+    """
+    job_key = new_job_id()
+    payload = {
+        "message": message.to_dict(),
+        "params": dict(params, job_id=job_key, user_id=user_id),
+        # Lets the worker continue this request's trace
+        "trace_id": current_trace_id()
+    }
+    with span('enqueue', kind=kind, job_key=job_key):
+        await asyncio.to_thread(get_broker().enqueue, kind, payload, job_key)
+    await message.reply_text(
+        "⏳ Your request has been queued and will start shortly.",
+        reply_markup=cancel_markup(job_key)
+    )
+    return job_key
\ No newline at end of file
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+from bot.config import (CACHE_WARMER, MAX_DOWNLOAD_SIZE, PEAK_HOURS, WARM_HISTORY_DAYS,
+                        WARM_HOURS, WARM_INTERVAL, WARM_MAX_MB_PER_RUN, WARM_MAX_TRACKS_PER_RUN,
+                        WARM_PLAYLISTS, WARM_RETRY_FAILED_DAYS, WARM_STORAGE_CHAT_ID)
+from bot.utils.botapi import upload_file
+from bot.utils.clients import get_spotify_client
+from bot.utils.downloader import fetch_track_audio
+from bot.utils.file_cache import get_file_cache
+from bot.utils.jobs import active_jobs, is_accepting, new_job_dir
+from bot.utils.tracing import log
+
+# Returned by _run_preemptible when a live job interrupted the warm step
+PREEMPTED = object()
+
+def parse_hours(spec):
+    """Parse an hour range like '2-7' or '22-3' (wrapping past midnight) into a set of hours.
+
+    An empty spec means the whole day.
+    """
+    if not spec.strip():
+        return set(range(24))
+    start, _, end = spec.partition('-')
+    start = int(start)
+    end = int(end) if end else start
+    if start <= end:
+        return set(range(start, end + 1))
+    return set(range(start, 24)) | set(range(0, end + 1))
+
+def is_busy():
+    """Live downloads always win over warming."""
+    return active_jobs() > 0 or not is_accepting()
+
+def _playlist_track_ids(playlist):
+    """Return the track ids of a Spotify playlist, given its URL or id."""
+    match = re.search(r'playlist/([a-zA-Z0-9]+)', playlist)
+    playlist_id = match.group(1) if match else playlist
+    sp = get_spotify_client()
+    results = sp.playlist_items(playlist_id, fields='items(track(id)),next', limit=100)
+    track_ids = []
+    while results:
+        track_ids.extend(
+            item['track']['id'] for item in results['items']
+            if item.get('track') and item['track'].get('id')
+        )
+        results = sp.next(results) if results.get('next') else None
+    return track_ids
+
+async def warm_candidates(cache):
+    """Return uncached track ids to warm: most requested first, then the admin playlists.
+
+    Tracks that failed to warm in the last WARM_RETRY_FAILED_DAYS days are skipped.
+    """
+    since = time.time() - WARM_HISTORY_DAYS * 86400
+    failed_since = time.time() - WARM_RETRY_FAILED_DAYS * 86400
+    keys = await asyncio.to_thread(
+        cache.popular_uncached, 'spotify:', since, WARM_MAX_TRACKS_PER_RUN, failed_since
+    )
+    track_ids = [key.split(':', 1)[1] for key in keys]
+    failed = await asyncio.to_thread(cache.warm_failures, failed_since) if WARM_PLAYLISTS else set()
+    for playlist in WARM_PLAYLISTS:
+        try:
+            playlist_ids = await asyncio.to_thread(_playlist_track_ids, playlist)
+        except Exception as e:
+            log(f"Cache warmer: could not read playlist {playlist}: {e}")
+            continue
+        cached = await asyncio.to_thread(cache.get_many, [f"spotify:{track_id}" for track_id in playlist_ids])
+        for track_id in playlist_ids:
+            key = f"spotify:{track_id}"
+            if key not in cached and key not in failed and track_id not in track_ids:
+                track_ids.append(track_id)
+    return track_ids[:WARM_MAX_TRACKS_PER_RUN]
+
+async def warm_track(bot, cache, track_id):
+    """Download a track at low priority and upload it to the storage chat.
+
+    Returns the number of bytes uploaded, or None if the track could not be warmed.
+    """
+    track = await asyncio.to_thread(get_spotify_client().track, track_id)
+    job_dir = new_job_dir('warm_')
+    try:
+        path = await fetch_track_audio(track, job_dir, low_priority=True)
+        if not path:
+            return None
+        file_size = os.path.getsize(path)
+        if file_size == 0 or file_size > MAX_DOWNLOAD_SIZE:
+            return None
+        track_name = track['name']
+        artists = ', '.join([artist['name'] for artist in track['artists']])
+        caption = f"Album: {track['album']['name']}"
+        with upload_file(path) as audio_file:
+            sent = await bot.send_audio(
+                chat_id=WARM_STORAGE_CHAT_ID,
+                audio=audio_file,
+                title=track_name,
+                performer=artists,
+                caption=caption,
+                disable_notification=True
+            )
+        await asyncio.to_thread(
+            cache.put, f"spotify:{track_id}", sent.audio.file_id, track_name, artists, caption, True
+        )
+        log(f"Cache warmer: warmed {track_name} by {artists} ({file_size} bytes)")
+        return file_size
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+async def _run_preemptible(coro):
+    """Run a warm step, cancelling it (and its spotdl process) as soon as a live job starts."""
+    task = asyncio.create_task(coro)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=1)
+            if not task.done() and is_busy():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                return PREEMPTED
+        return task.result()
+    except asyncio.CancelledError:
+        # The warmer itself is being stopped
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        raise
+
+async def warm_once(bot, cache):
+    """Warm as many candidate tracks as the per-run budget allows. Returns how many were warmed."""
+    budget = WARM_MAX_MB_PER_RUN * 1024 * 1024
+    warmed = 0
+    for track_id in await warm_candidates(cache):
+        if is_busy():
+            log("Cache warmer: live traffic, pausing")
+            break
+        try:
+            result = await _run_preemptible(warm_track(bot, cache, track_id))
+        except Exception as e:
+            log(f"Cache warmer: failed to warm {track_id}: {e}")
+            result = None
+        if result is PREEMPTED:
+            log("Cache warmer: preempted by a live download")
+            break
+        if not result:
+            # Skip it for WARM_RETRY_FAILED_DAYS rather than retrying it every run
+            await asyncio.to_thread(cache.record_warm_failure, f"spotify:{track_id}")
+            continue
+        warmed += 1
+        budget -= result
+        if budget <= 0:
+            break
+    return warmed
+
+async def warm_report(cache, days=7):
+    """Describe how much peak-hour traffic the warmed entries turned into instant cache hits."""
+    stats = await asyncio.to_thread(cache.request_stats, time.time() - days * 86400, parse_hours(PEAK_HOURS))
+    requests = stats['requests']
+    if not requests:
+        return f"No peak-hour ({PEAK_HOURS}h) requests in the last {days} days."
+    return (
+        f"Peak-hour ({PEAK_HOURS}h) requests in the last {days} days: {requests}\n"
+        f"Cache hits: {stats['hits']} ({stats['hits'] * 100 / requests:.0f}%)\n"
+        f"Hits on warmed tracks: {stats['warmed_hits']} ({stats['warmed_hits'] * 100 / requests:.0f}%)"
+    )
+
+async def run_cache_warmer(bot):
+    """Warm the cache every WARM_INTERVAL seconds while in WARM_HOURS and idle."""
+    cache = get_file_cache()
+    warm_hours = parse_hours(WARM_HOURS)
+    while True:
+        await asyncio.sleep(WARM_INTERVAL)
+        if datetime.now().hour not in warm_hours or is_busy():
+            continue
+        try:
+            warmed = await warm_once(bot, cache)
+            log(f"Cache warmer: warmed {warmed} track(s) this run")
+            log(await warm_report(cache))
+        except Exception as e:
+            log(f"Cache warmer error: {e}")
+
+def start_cache_warmer(bot):
+    """Start the warmer as a background task if it is enabled. Returns the task or None."""
+    if not CACHE_WARMER:
+        return None
+    if not WARM_STORAGE_CHAT_ID:
+        print("CACHE_WARMER is on but WARM_STORAGE_CHAT_ID is not set, not starting the cache warmer")
+        return None
+    print(f"Cache warmer enabled during hours {WARM_HOURS}")
+    return asyncio.create_task(run_cache_warmer(bot))
\ No newline at end of file
@@ -0,0 +1,29 @@
+import threading
+from bot.config import HTTP_TIMEOUT, MAX_RETRIES, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET
+from bot.utils.startup import timed_phase
+
+_spotify = None
+_spotify_lock = threading.Lock()
+
+def get_spotify_client():
+    """Return the shared Spotify client, importing and creating it on first use.
+
+    spotipy is synchronous (it keeps its own pooled requests session), so async
+    code should call it through asyncio.to_thread().
+    """
+    global _spotify
+    if _spotify is None:
+        with _spotify_lock:
+            if _spotify is None:
+                with timed_phase('spotify client'):
+                    import spotipy
+                    from spotipy.oauth2 import SpotifyClientCredentials
+                    _spotify = spotipy.Spotify(
+                        auth_manager=SpotifyClientCredentials(
+                            client_id=SPOTIFY_CLIENT_ID,
+                            client_secret=SPOTIFY_CLIENT_SECRET
+                        ),
+                        requests_timeout=HTTP_TIMEOUT,
+                        retries=MAX_RETRIES
+                    )
+    return _spotify
\ No newline at end of file
@@ -1,31 +1,76 @@
 import os
-import requests
+import glob
 import subprocess
 import json
 import re
 import io
 import tempfile
-from bot.config import HIGH_QUALITY, MAX_RETRIES, SPOTIFY_QUALITY, YOUTUBE_QUALITY
+from bot.config import (HIGH_QUALITY, LOCAL_BOT_API, MAX_DOWNLOAD_SIZE, MAX_RETRIES, SPOTIFY_QUALITY,
+                        YOUTUBE_QUALITY)
+from bot.utils.jobs import run_process
+from bot.utils.tracing import log, span
+
+# Standard mp3 bitrates (kbps), best first
+MP3_BITRATES = [320, 256, 192, 160, 128, 96, 64]
+# Bitrate used when the public Bot API's 50MB limit applies and the duration is unknown
+DEFAULT_BITRATE = 128
 
 def ensure_directory_exists(directory):
     """Create directory if it doesn't exist."""
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+def choose_bitrate(duration_seconds=None):
+    """Pick the mp3 bitrate (kbps) for a download that has to fit the upload limit."""
+    best = SPOTIFY_QUALITY if HIGH_QUALITY else DEFAULT_BITRATE
+    # 2GB holds more than 14 hours of 320kbps audio, so there is nothing to trade off
+    if LOCAL_BOT_API:
+        return best
+    if not duration_seconds:
+        return min(best, DEFAULT_BITRATE)
+    # Leave 10% headroom for tags and cover art
+    fitting = MAX_DOWNLOAD_SIZE * 0.9 * 8 / 1000 / duration_seconds
+    for bitrate in MP3_BITRATES:
+        if bitrate <= best and bitrate <= fitting:
+            return bitrate
+    return MP3_BITRATES[-1]
+
+def max_filesize_arg():
+    """Return the yt-dlp --max-filesize value for the active upload limit."""
+    return f"{int(MAX_DOWNLOAD_SIZE * 0.9) // (1024 * 1024)}M"
+
+async def fetch_track_audio(track, job_dir, low_priority=False):
+    """Download a Spotify track object's mp3 into job_dir with spotdl.
+
+    Returns the path of the mp3, or None if spotdl produced nothing.
+    """
+    bitrate = choose_bitrate(track['duration_ms'] / 1000)
+    url = f"https://open.spotify.com/track/{track['id']}"
+    cmd = ['spotdl', '--output', job_dir, '--bitrate', f"{bitrate}k", url]
+    log("Running command:", ' '.join(cmd))
+    # spotdl searches for the source, downloads and transcodes in one process
+    with span('download', backend='spotdl', bitrate=bitrate, low_priority=low_priority) as download:
+        returncode, stdout, stderr = await run_process(cmd, low_priority=low_priority)
+        download.set(returncode=returncode)
+    log("spotdl stdout:", stdout)
+    log("spotdl stderr:", stderr)
+
+    # Find the newest mp3 file
+    mp3_files = glob.glob(os.path.join(job_dir, "*.mp3"))
+    if not mp3_files:
+        log("No mp3 files found in", job_dir)
+        return None
+    latest_file = max(mp3_files, key=os.path.getctime)
+    download.set(bytes=os.path.getsize(latest_file))
+    return latest_file
+
 def download_spotify_track(track_id, output_path=None):
     """Stream a Spotify track directly to memory using yt-dlp."""
     try:
         # Get track info from Spotify API
-        from spotipy import Spotify
-        from spotipy.oauth2 import SpotifyClientCredentials
-        from bot.config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET
-        
-        sp = Spotify(auth_manager=SpotifyClientCredentials(
-            client_id=SPOTIFY_CLIENT_ID,
-            client_secret=SPOTIFY_CLIENT_SECRET
-        ))
+        from bot.utils.clients import get_spotify_client
         
-        track = sp.track(track_id)
+        track = get_spotify_client().track(track_id)
         track_name = track['name']
         artists = ', '.join([artist['name'] for artist in track['artists']])
         search_query = f"{artists} - {track_name} audio"
@@ -42,8 +87,8 @@ def download_spotify_track(track_id, output_path=None):
             'ytsearch1:' + search_query,
             '-x',  # Extract audio
             '--audio-format', 'mp3',
-            '--max-filesize', '45M',  # Limit file size for Telegram
-            '--audio-quality', '128K',  # Lower quality for smaller file size
+            '--max-filesize', max_filesize_arg(),  # Limit file size for Telegram
+            '--audio-quality', f"{choose_bitrate(track['duration_ms'] / 1000)}K",
             '-o', temp_path,
             '--no-warnings'
         ], check=True)
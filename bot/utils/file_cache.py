@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from bot.config import CACHE_DB_PATH
+
+class FileIdCache:
+    """Maps content keys like 'spotify:<track id>' to Telegram file_ids of files we already sent.
+
+    A file_id can be sent again (or offered in inline results) without downloading
+    or uploading anything. file_ids are only valid for the bot that uploaded them.
+    Also keeps the request history the cache warmer learns from. Backed by SQLite
+    in WAL mode so the bot and workers on one host share it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " content_key TEXT PRIMARY KEY,"
+                " file_id TEXT NOT NULL,"
+                " title TEXT,"
+                " performer TEXT,"
+                " caption TEXT,"
+                " warmed INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL)"
+            )
+            # Databases created before the cache warmer lack the warmed column
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(files)")]
+            if 'warmed' not in columns:
+                conn.execute("ALTER TABLE files ADD COLUMN warmed INTEGER NOT NULL DEFAULT 0")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS requests ("
+                " content_key TEXT NOT NULL,"
+                " requested_at REAL NOT NULL,"
+                " cache_hit INTEGER NOT NULL,"
+                " warmed INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS requests_time ON requests (requested_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS warm_failures ("
+                " content_key TEXT PRIMARY KEY,"
+                " failed_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return closing(conn)
+
+    def get(self, content_key):
+        """Return the cached entry for a content key, or None."""
+        return self.get_many([content_key]).get(content_key)
+
+    def get_many(self, content_keys):
+        """Return a content key -> entry dict for the keys that are cached."""
+        if not content_keys:
+            return {}
+        placeholders = ', '.join('?' * len(content_keys))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM files WHERE content_key IN ({placeholders})",
+                list(content_keys)
+            ).fetchall()
+        return {row['content_key']: dict(row) for row in rows}
+
+    def put(self, content_key, file_id, title=None, performer=None, caption=None, warmed=False):
+        """Remember the file_id Telegram assigned to an uploaded file.
+
+        warmed marks entries the cache warmer uploaded ahead of any request.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files"
+                " (content_key, file_id, title, performer, caption, warmed, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_key, file_id, title, performer, caption, int(warmed), time.time())
+            )
+
+    def record_request(self, content_key, cache_hit):
+        """Add a user request to the history, noting whether the cache answered it."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO requests (content_key, requested_at, cache_hit, warmed) VALUES (?, ?, ?,"
+                " CASE WHEN ? THEN COALESCE((SELECT warmed FROM files WHERE content_key = ?), 0) ELSE 0 END)",
+                (content_key, time.time(), int(cache_hit), int(cache_hit), content_key)
+            )
+
+    def popular_uncached(self, prefix, since, limit, failed_since=0):
+        """Return the most requested content keys starting with prefix that are not cached.
+
+        Keys that failed to warm since failed_since are skipped, so tracks that can't
+        be downloaded don't take every warm run's slots.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT content_key, COUNT(*) AS requests FROM requests"
+                " WHERE requested_at >= ? AND content_key LIKE ?"
+                " AND content_key NOT IN (SELECT content_key FROM files)"
+                " AND content_key NOT IN (SELECT content_key FROM warm_failures WHERE failed_at >= ?)"
+                " GROUP BY content_key ORDER BY requests DESC LIMIT ?",
+                (since, prefix + '%', failed_since, limit)
+            ).fetchall()
+        return [row['content_key'] for row in rows]
+
+    def record_warm_failure(self, content_key):
+        """Remember that the cache warmer could not warm a content key."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO warm_failures (content_key, failed_at) VALUES (?, ?)",
+                (content_key, time.time())
+            )
+
+    def warm_failures(self, since):
+        """Return the content keys that failed to warm since a timestamp."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT content_key FROM warm_failures WHERE failed_at >= ?", (since,)
+            ).fetchall()
+        return {row['content_key'] for row in rows}
+
+    def request_stats(self, since, hours=None):
+        """Count requests, cache hits and hits on warmed entries since a timestamp.
+
+        hours restricts the count to requests made in those local hours of the day.
+        """
+        query = (
+            "SELECT COUNT(*) AS requests, COALESCE(SUM(cache_hit), 0) AS hits,"
+            " COALESCE(SUM(warmed), 0) AS warmed_hits FROM requests WHERE requested_at >= ?"
+        )
+        params = [since]
+        if hours is not None:
+            query += (
+                " AND CAST(strftime('%H', requested_at, 'unixepoch', 'localtime') AS INTEGER)"
+                f" IN ({', '.join('?' * len(hours))})"
+            )
+            params.extend(sorted(hours))
+        with self._connect() as conn:
+            return dict(conn.execute(query, params).fetchone())
+
+    def delete(self, content_key):
+        """Forget a file_id, e.g. after Telegram rejected it."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM files WHERE content_key = ?", (content_key,))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_file_cache():
+    """Return the shared file_id cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FileIdCache(CACHE_DB_PATH)
+    return _cache
\ No newline at end of file
@@ -1,3 +1,5 @@
+from bot.utils.http import get_json
+
 def format_track_data(track):
     return {
         "title": track.get("title"),
@@ -15,8 +17,5 @@ def format_video_data(video):
         "url": video.get("url"),
     }
 
-def manage_api_request(url, params=None):
-    import requests
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    return response.json()
\ No newline at end of file
+async def manage_api_request(url, params=None):
+    return await get_json(url, params=params)
\ No newline at end of file
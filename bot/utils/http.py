@@ -0,0 +1,107 @@
+import asyncio
+import random
+from urllib.parse import urlsplit
+from bot.config import (HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX, HTTP_MAX_CONCURRENCY_PER_HOST, HTTP_TIMEOUT,
+                        MAX_RETRIES)
+from bot.utils.tracing import log, span
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Only idempotent requests are retried, so a POST is never silently sent twice
+RETRY_METHODS = {'GET', 'HEAD'}
+
+_client = None
+_host_limits = {}
+
+def _http2_available():
+    """HTTP/2 needs the optional h2 package (installed by httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def get_client():
+    """Return the shared httpx client, creating it on first use.
+
+    httpx keeps a keep-alive connection pool, so repeated calls to the same API
+    reuse TCP/TLS connections instead of handshaking every time. The pool's limits
+    are global (httpx defaults); _host_limit caps the requests in flight per host.
+    """
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(
+            http2=_http2_available(),
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+        )
+    return _client
+
+def _host_limit(url):
+    """Return the semaphore capping concurrent requests to the URL's host."""
+    host = urlsplit(url).hostname
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(HTTP_MAX_CONCURRENCY_PER_HOST)
+    return _host_limits[host]
+
+def _backoff(attempt, response=None):
+    """Seconds to wait before the next attempt: Retry-After if given, else jittered exponential."""
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(int(retry_after), HTTP_BACKOFF_MAX)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+async def request(method, url, **kwargs):
+    """Send a request through the shared client, retrying GET/HEAD up to MAX_RETRIES times.
+
+    Connection errors, timeouts and RETRY_STATUSES responses are retried; the last
+    response is returned as is, so callers still decide what a bad status means.
+    Other methods are sent once.
+    """
+    import httpx
+    retries = MAX_RETRIES if method.upper() in RETRY_METHODS else 0
+    with span('http', method=method, host=urlsplit(url).hostname) as http_span:
+        for attempt in range(retries + 1):
+            http_span.set(attempts=attempt + 1)
+            try:
+                async with _host_limit(url):
+                    response = await get_client().request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == retries:
+                    raise
+                delay = _backoff(attempt)
+                log(f"HTTP {method} {url} failed ({e!r}), retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    http_span.set(status=response.status_code, http_version=response.http_version)
+                    return response
+                delay = _backoff(attempt, response)
+                log(f"HTTP {method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def get_json(url, params=None):
+    """GET a URL and return its decoded JSON body, raising on error statuses."""
+    response = await request('GET', url, params=params)
+    response.raise_for_status()
+    return response.json()
+
+async def get_bytes(url):
+    """GET a URL and return its body, raising on error statuses."""
+    response = await request('GET', url)
+    response.raise_for_status()
+    return response.content
+
+async def resolve_redirects(url):
+    """Follow redirects from a (shortened) URL and return the final URL."""
+    response = await request('HEAD', url)
+    return str(response.url)
+
+async def close_client():
+    """Close the shared client's connections on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
\ No newline at end of file
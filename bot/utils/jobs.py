@@ -0,0 +1,136 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from bot.config import DOWNLOAD_DIRECTORY, MAX_CONCURRENT_DOWNLOADS
+
+# Job id -> the asyncio task running it, for every download in this process
+_jobs = {}
+# Job id -> message to show the user once the job's cancellation lands
+_cancel_notices = {}
+# Job id -> id of the user who requested it, the only one allowed to cancel it
+_owners = {}
+_accepting = True
+_download_slots = None
+
+class JobFailed(Exception):
+    """Raised by a download job after it has already told the user why it failed."""
+
+def new_job_id():
+    """Return a short id for a new download job."""
+    return uuid.uuid4().hex[:12]
+
+def new_job_dir(prefix):
+    """Create a directory of its own for one job's files under DOWNLOAD_DIRECTORY.
+
+    Concurrent jobs never pick up each other's files, and a local Bot API server,
+    which reads uploads from disk, only needs to share DOWNLOAD_DIRECTORY.
+    """
+    os.makedirs(DOWNLOAD_DIRECTORY, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=DOWNLOAD_DIRECTORY)
+
+def cancel_markup(job_id):
+    """Inline keyboard with a Cancel button for a job status message."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("✖️ Cancel", callback_data=f"cancel_{job_id}")]])
+
+@contextmanager
+def track_job(job_id, user_id=None):
+    """Register the current task under job_id so it can be cancelled or drained."""
+    _jobs[job_id] = asyncio.current_task()
+    _owners[job_id] = user_id
+    try:
+        yield
+    finally:
+        _jobs.pop(job_id, None)
+        _owners.pop(job_id, None)
+        _cancel_notices.pop(job_id, None)
+
+def cancel_job(job_id, notice="✖️ Download cancelled."):
+    """Cancel a job running in this process. Returns False if there is no such job."""
+    task = _jobs.get(job_id)
+    if task is None or task.done():
+        return False
+    _cancel_notices[job_id] = notice
+    task.cancel()
+    return True
+
+def job_owner(job_id):
+    """Return the id of the user who requested a job running in this process, or None."""
+    return _owners.get(job_id)
+
+def cancel_notice(job_id):
+    """Return the message to show for a cancelled job, or None to stay silent."""
+    return _cancel_notices.get(job_id)
+
+def active_jobs():
+    """Return the number of jobs running in this process."""
+    return len(_jobs)
+
+def is_accepting():
+    """Check whether new downloads may start (False once shutdown has begun)."""
+    return _accepting
+
+def stop_accepting():
+    """Refuse new downloads from now on."""
+    global _accepting
+    _accepting = False
+
+async def drain(timeout, notice):
+    """Wait up to timeout seconds for running jobs, then cancel the rest.
+
+    Returns the number of jobs that had to be interrupted.
+    """
+    tasks = set(_jobs.values())
+    if not tasks:
+        return 0
+    print(f"Draining {len(tasks)} running job(s), waiting up to {timeout:.0f}s")
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for job_id, task in list(_jobs.items()):
+        if task in pending:
+            cancel_job(job_id, notice)
+    # Give the cancelled jobs a moment to kill their subprocesses and clean up
+    await asyncio.gather(*pending, return_exceptions=True)
+    return len(pending)
+
+def _slots():
+    """Return the semaphore limiting concurrent download processes (created in the running loop)."""
+    global _download_slots
+    if _download_slots is None:
+        _download_slots = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    return _download_slots
+
+async def run_process(args, low_priority=False):
+    """Run a subprocess and return (returncode, stdout, stderr).
+
+    At most MAX_CONCURRENT_DOWNLOADS processes run at once; the rest wait for a
+    slot, still cancellable. If the calling job is cancelled, the subprocess is
+    terminated (and killed if it doesn't exit promptly) before the cancellation
+    propagates. low_priority runs it under nice, where the platform has it.
+    """
+    async with _slots():
+        return await _run_process(args, low_priority)
+
+async def _run_process(args, low_priority):
+    if low_priority and shutil.which('nice'):
+        # Not preexec_fn: that is unsafe in a process that runs threads
+        args = ['nice', '-n', '19', *args]
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        raise
+    return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
\ No newline at end of file
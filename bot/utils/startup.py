@@ -0,0 +1,119 @@
+import asyncio
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# External tools the download paths rely on, with the command that prints their version
+TOOLS = {
+    'ffmpeg': ['ffmpeg', '-version'],
+    'yt-dlp': ['yt-dlp', '--version'],
+    'spotdl': ['spotdl', '--version'],
+}
+
+_phases = []
+_reported = False
+_reported_total_ms = 0
+# Guards the report against the background probe finishing at the same moment
+_report_lock = threading.Lock()
+_probe_lock = threading.Lock()
+_probe_pending = False
+_tool_versions = None
+
+@contextmanager
+def timed_phase(name):
+    """Time a startup phase and record it for the startup report."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, start)
+
+def record_phase(name, start):
+    """Record a phase that began at the given perf_counter() value."""
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _phases.append((name, elapsed_ms))
+    # Phases that happen after the report (lazy initialisation) are logged on their own
+    if _reported:
+        print(f"Lazy init: {name} took {elapsed_ms:.0f}ms")
+
+def report_startup():
+    """Print the startup breakdown recorded so far.
+
+    The background tool probe usually outlasts the rest of startup; it is then
+    listed as pending and reported with the new total once it finishes.
+    """
+    global _reported, _reported_total_ms
+    with _report_lock:
+        _reported = True
+        phases = list(_phases)
+        _reported_total_ms = sum(elapsed_ms for _, elapsed_ms in phases)
+        probe_pending = _probe_pending
+    print(f"Startup finished in {_reported_total_ms:.0f}ms")
+    for name, elapsed_ms in phases:
+        print(f"  {name}: {elapsed_ms:.0f}ms")
+    if probe_pending:
+        print("  tool probe: still running in the background")
+
+def _record_probe(start):
+    """Record the tool probe, following up on the startup report if it already ran."""
+    global _probe_pending
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _report_lock:
+        _phases.append(('tool probe', elapsed_ms))
+        follow_up = _reported and _probe_pending
+        _probe_pending = False
+    if follow_up:
+        print(
+            f"Startup tool probe finished in {elapsed_ms:.0f}ms"
+            f" (startup total including it: {_reported_total_ms + elapsed_ms:.0f}ms)"
+        )
+    elif _reported:
+        print(f"Lazy init: tool probe took {elapsed_ms:.0f}ms")
+
+def _probe_tool(cmd):
+    """Return the first line of a tool's version output, or None if it is unusable."""
+    if shutil.which(cmd[0]) is None:
+        return None
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    output = result.stdout.strip() or result.stderr.strip()
+    return output.splitlines()[0] if output else ''
+
+def probe_tools():
+    """Probe the external tools once and return a name -> version (or None) mapping."""
+    global _tool_versions
+    with _probe_lock:
+        if _tool_versions is None:
+            start = time.perf_counter()
+            # spotdl alone takes a second or two to start, so probe the tools in parallel
+            with ThreadPoolExecutor(max_workers=len(TOOLS)) as pool:
+                versions = pool.map(_probe_tool, TOOLS.values())
+            _tool_versions = dict(zip(TOOLS, versions))
+            _record_probe(start)
+            for name, version in _tool_versions.items():
+                print(f"Tool {name}: {version if version is not None else 'NOT FOUND'}")
+    return _tool_versions
+
+def start_tool_probe():
+    """Run the tool probe in the background so it doesn't delay startup."""
+    global _probe_pending
+    _probe_pending = True
+    threading.Thread(target=probe_tools, name='tool-probe', daemon=True).start()
+
+async def has_tool(name):
+    """Check whether an external tool is available, probing on first use.
+
+    The probe can take seconds (and may already be running in the background
+    thread), so wait for it off the event loop.
+    """
+    versions = _tool_versions
+    if versions is None:
+        versions = await asyncio.to_thread(probe_tools)
+    return versions.get(name) is not None
\ No newline at end of file
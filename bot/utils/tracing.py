@@ -0,0 +1,174 @@
+import functools
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from bot.config import (TRACE_EXPORT_PATH, TRACE_LOG_BACKUPS, TRACE_LOG_MAX_BYTES, TRACE_SLOW_LOG,
+                        TRACE_SLOW_THRESHOLD)
+
+# Spans are only recorded when something will read them; trace ids are always assigned
+# so log lines can be correlated either way
+TRACING_ENABLED = TRACE_SLOW_THRESHOLD > 0 or bool(TRACE_EXPORT_PATH)
+
+_current_trace = ContextVar('trace', default=None)
+_current_span = ContextVar('span', default=None)
+_loggers = {}
+
+class Span:
+    """One timed step of a trace, with free-form attributes (cache hit, backend, bytes...)."""
+
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.parent = parent
+        self.attrs = dict(attrs)
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        """Add or overwrite attributes."""
+        self.attrs.update(attrs)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+class _NoopSpan:
+    """Stands in for a Span when tracing is disabled or there is no current trace."""
+
+    def set(self, **attrs):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    """All spans recorded while handling one update or job."""
+
+    def __init__(self, name, trace_id, attrs):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.root = Span(name, None, attrs)
+        self.spans = [self.root]
+
+    def to_dict(self):
+        index = {id(span): i for i, span in enumerate(self.spans)}
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": round(self.started_at, 3),
+            "duration_ms": round(self.root.duration * 1000, 1),
+            "attrs": self.root.attrs,
+            "spans": [
+                {
+                    "name": span.name,
+                    "parent": index.get(id(span.parent)),
+                    "offset_ms": round((span.start - self.root.start) * 1000, 1),
+                    "duration_ms": round(span.duration * 1000, 1) if span.duration is not None else None,
+                    "attrs": span.attrs
+                }
+                for span in self.spans[1:]
+            ]
+        }
+
+@contextmanager
+def trace(name, trace_id=None, **attrs):
+    """Start a trace for the current update or job and yield its root span.
+
+    Pass trace_id to continue a trace started in another process (e.g. the
+    front-end that enqueued a job).
+    """
+    current = Trace(name, trace_id, attrs)
+    trace_token = _current_trace.set(current)
+    span_token = _current_span.set(current.root)
+    try:
+        yield current.root
+    except BaseException as e:
+        current.root.set(error=repr(e))
+        # Error handlers run after the trace has ended, so tag the exception with its id
+        try:
+            e.trace_id = current.trace_id
+        except AttributeError:
+            pass
+        raise
+    finally:
+        current.root.finish()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        _finish_trace(current)
+
+@contextmanager
+def span(name, **attrs):
+    """Time a step of the current trace and yield the span, to set attributes on."""
+    current = _current_trace.get()
+    if current is None or not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+    new_span = Span(name, _current_span.get(), attrs)
+    current.spans.append(new_span)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.set(error=repr(e))
+        raise
+    finally:
+        new_span.finish()
+        _current_span.reset(token)
+
+def traced(name):
+    """Decorator that runs a PTB handler inside a new trace."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            attrs = {"update_id": getattr(update, 'update_id', None)}
+            user = getattr(update, 'effective_user', None)
+            if user:
+                attrs["user_id"] = user.id
+            with trace(name, **attrs):
+                return await handler(update, context)
+        return wrapper
+    return decorator
+
+def current_trace_id():
+    """Return the current trace id, or None outside a trace."""
+    current = _current_trace.get()
+    return current.trace_id if current else None
+
+def log(*args):
+    """print() prefixed with the current trace id, so output can be tied to a request."""
+    trace_id = current_trace_id()
+    if trace_id:
+        print(f"[{trace_id}]", *args)
+    else:
+        print(*args)
+
+def _get_logger(path):
+    """Return a logger writing raw lines to a size-rotated file."""
+    if path not in _loggers:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        logger = logging.getLogger(f"loadtunez.traces.{path}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(path, maxBytes=TRACE_LOG_MAX_BYTES, backupCount=TRACE_LOG_BACKUPS)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        _loggers[path] = logger
+    return _loggers[path]
+
+def _finish_trace(current):
+    """Write a finished trace to the export file and, if it was slow, to the slow log."""
+    if not TRACING_ENABLED:
+        return
+    slow = TRACE_SLOW_THRESHOLD > 0 and current.root.duration >= TRACE_SLOW_THRESHOLD
+    if not slow and not TRACE_EXPORT_PATH:
+        return
+    line = json.dumps(current.to_dict(), separators=(',', ':'), default=str)
+    if TRACE_EXPORT_PATH:
+        _get_logger(TRACE_EXPORT_PATH).info(line)
+    if slow:
+        print(f"[{current.trace_id}] Slow request: {current.root.name} took {current.root.duration:.1f}s")
+        _get_logger(TRACE_SLOW_LOG).info(line)
\ No newline at end of file
@@ -1,17 +1,28 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from telegram.error import BadRequest, TimedOut, NetworkError
-from bot.handlers.spotify import handle_spotify_url, handle_spotify_callback, search_spotify
-from bot.handlers.tiktok import handle_tiktok_url
-from bot.handlers.youtube import handle_youtube_url
-from bot.handlers.instagram import handle_instagram_url
-from bot.config import API_TOKEN, DOWNLOAD_DIRECTORY  # <-- Add DOWNLOAD_DIRECTORY to the import
+import time
+_IMPORT_START = time.perf_counter()
+
+import asyncio
 import os
+import re
+import signal
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
+# Load environment variables from .env file (before bot.config reads them)
 load_dotenv()
-import re
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram.ext import (Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler,
+                          InlineQueryHandler, ChosenInlineResultHandler)
+from telegram.error import BadRequest, TimedOut, NetworkError
+from bot.config import ADMIN_USER_IDS, API_TOKEN, BOT_MODE, DOWNLOAD_DIRECTORY, DRAIN_TIMEOUT  # <-- Add DOWNLOAD_DIRECTORY to the import
+from bot.utils.botapi import configure_builder
+from bot.utils.http import close_client
+from bot.utils.jobs import cancel_job, drain, is_accepting, job_owner, stop_accepting
+from bot.utils.startup import record_phase, report_startup, start_tool_probe, timed_phase
+from bot.utils.tracing import log, traced
+
+# Platform handlers (and the clients they pull in) are imported on first use
+record_phase('imports', _IMPORT_START)
 
 # URL patterns for different platforms
 SPOTIFY_PATTERN = r'(https?://(open\.spotify\.com|spotify\.link)/(track|album|playlist)/[a-zA-Z0-9]+)'
@@ -19,8 +30,22 @@ TIKTOK_PATTERN = r'(https?://(www\.)?(tiktok\.com|vm\.tiktok\.com)/[@a-zA-Z0-9_\
 YOUTUBE_PATTERN = r'(https?://(www\.)?(youtube\.com/watch\?v=|youtu\.be/)[a-zA-Z0-9_-]+)'
 INSTAGRAM_PATTERN = r'(https?://(www\.)?(instagram\.com/reel/[a-zA-Z0-9_-]+|instagram\.com/p/[a-zA-Z0-9_-]+))'
 
+RESTARTING_TEXT = "🔄 The bot is restarting. Please send your request again in a minute."
+
+@traced('start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a welcome message when the command /start is issued."""
+    # Deep link from an inline result: /start track_<spotify id>
+    if context.args and context.args[0].startswith('track_'):
+        if not is_accepting():
+            await update.message.reply_text(RESTARTING_TEXT)
+            return
+        from bot.handlers.spotify import start_track_download
+        await start_track_download(
+            update.message, context.args[0].replace('track_', '', 1), update.effective_user.id
+        )
+        return
+    
     # Inline keyboard for platform info
     inline_keyboard = [
         [InlineKeyboardButton("Spotify", callback_data='info_spotify')],
@@ -51,17 +76,50 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         reply_markup=reply_markup
     )
 
+async def cancel_download(query, job_id):
+    """Cancel a download job, whether it runs here or in a worker process.
+
+    Only the user who requested the download may cancel it, which matters in groups.
+    """
+    from bot.utils.broker import get_broker
+    owner = job_owner(job_id)
+    if owner is None and BOT_MODE == 'frontend':
+        owner = await asyncio.to_thread(get_broker().owner, job_id)
+    if owner is not None and owner != query.from_user.id:
+        await query.answer("Only the user who started this download can cancel it.", show_alert=True)
+        return
+    await query.answer()
+    # A job running in this process edits its own status message once it stops
+    if cancel_job(job_id):
+        return
+    if BOT_MODE == 'frontend':
+        if await asyncio.to_thread(get_broker().request_cancel, job_id):
+            await query.edit_message_text("✖️ Download cancelled.")
+            return
+    # The job already finished, so just drop the stale button
+    await query.edit_message_reply_markup(reply_markup=None)
+
+@traced('button_callback')
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button callbacks."""
     query = update.callback_query
     
     try:
-        await query.answer()
-        
         data = query.data
         
+        # Handle Cancel buttons on job status messages (answered there, to explain a refusal)
+        if data.startswith('cancel_'):
+            await cancel_download(query, data.replace('cancel_', ''))
+            return
+        
+        await query.answer()
+        
         # Handle Spotify download callbacks
         if data.startswith('dl_track_') or data.startswith('dl_album_'):
+            if not is_accepting():
+                await query.message.reply_text(RESTARTING_TEXT)
+                return
+            from bot.handlers.spotify import handle_spotify_callback
             await handle_spotify_callback(update, context)
             return
         
@@ -105,10 +163,31 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 parse_mode='Markdown'
             )
     except (BadRequest, TimedOut) as e:
-        print(f"Callback error: {e}")
+        log(f"Callback error: {e}")
         # If the callback query is too old, we can't answer it
         # Just continue with the operation
 
+@traced('inline_query')
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle inline queries (@bot song name)."""
+    from bot.handlers.spotify import handle_inline_query
+    await handle_inline_query(update, context)
+
+@traced('chosen_inline_result')
+async def chosen_inline_result(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle inline results the user picked and sent."""
+    from bot.handlers.spotify import handle_chosen_inline_result
+    await handle_chosen_inline_result(update, context)
+
+@traced('cachestats_command')
+async def cachestats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Report how much peak traffic the cache warmer turned into cache hits (admins only)."""
+    if not update.effective_user or update.effective_user.id not in ADMIN_USER_IDS:
+        return
+    from bot.utils.cache_warmer import warm_report
+    from bot.utils.file_cache import get_file_cache
+    await update.message.reply_text(await warm_report(get_file_cache()))
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
     await update.message.reply_text(
@@ -123,10 +202,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         '• Instagram (reels)\n\n'
         'Special commands:\n'
         '• /search [query] - Search for tracks and albums on Spotify\n'
+        '• @botname [query] in any chat - Share a track inline\n'
         '• /help - Show this help message\n'
         '• /start - Start the bot'
     )
 
+@traced('search_command')
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /search command."""
     if not context.args:
@@ -134,8 +215,10 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     query = ' '.join(context.args)
+    from bot.handlers.spotify import search_spotify
     await search_spotify(update, context, query)
 
+@traced('handle_url')
 async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle URLs sent by the user."""
     text = update.message.text
@@ -194,20 +277,30 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     # Check for Spotify search
     if text.lower().startswith('search '):
         query = text[7:]  # Remove 'search ' prefix
+        from bot.handlers.spotify import search_spotify
         await search_spotify(update, context, query)
         return
     
+    # Don't start new downloads while shutting down
+    if not is_accepting():
+        await update.message.reply_text(RESTARTING_TEXT)
+        return
+    
     # Check for Spotify links
     if re.search(SPOTIFY_PATTERN, text):
+        from bot.handlers.spotify import handle_spotify_url
         await handle_spotify_url(update, context)
     # Check for TikTok links
     elif re.search(TIKTOK_PATTERN, text):
+        from bot.handlers.tiktok import handle_tiktok_url
         await handle_tiktok_url(update, context)
     # Check for YouTube links
     elif re.search(YOUTUBE_PATTERN, text):
+        from bot.handlers.youtube import handle_youtube_url
         await handle_youtube_url(update, context)
     # Check for Instagram links
     elif re.search(INSTAGRAM_PATTERN, text):
+        from bot.handlers.instagram import handle_instagram_url
         await handle_instagram_url(update, context)
     else:
         await update.message.reply_text(
@@ -217,7 +310,9 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Log errors caused by updates."""
-    print(f"Update {update} caused error {context.error}")
+    trace_id = getattr(context.error, 'trace_id', None)
+    prefix = f"[{trace_id}] " if trace_id else ""
+    print(f"{prefix}Update {update} caused error {context.error}")
     
     # If the error is related to a message, inform the user
     if update and update.effective_message:
@@ -227,54 +322,106 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def main() -> None:
     """Start the bot."""
+    if BOT_MODE == 'frontend':
+        # Jobs enqueued into a broker no worker can reach would never run
+        from bot.utils.broker import check_shared_broker
+        check_shared_broker()
+
+    # Probe ffmpeg/yt-dlp/spotdl in the background instead of on every download.
+    # A front-end never downloads anything itself, so it skips the probe.
+    if BOT_MODE != 'frontend':
+        start_tool_probe()
+
     # Create the Application and pass it your bot's token
-    application = Application.builder().token(API_TOKEN).build()
+    with timed_phase('application build'):
+        # Concurrent updates let a Cancel button be handled while a download is running;
+        # run_process still caps downloads at MAX_CONCURRENT_DOWNLOADS
+        builder = Application.builder().token(API_TOKEN).concurrent_updates(True)
+        # Use the self-hosted Bot API server if BOT_API_BASE_URL is set
+        application = configure_builder(builder).build()
 
-    # Register command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("search", search_command))
-    
-    # Register callback query handler for button callbacks
-    application.add_handler(CallbackQueryHandler(button_callback))
-    
-    # Register message handler for URLs
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_url))
-    
-    # Register error handler
-    application.add_error_handler(error_handler)
+    with timed_phase('handler registration'):
+        # Register command handlers
+        application.add_handler(CommandHandler("start", start))
+        application.add_handler(CommandHandler("help", help_command))
+        application.add_handler(CommandHandler("search", search_command))
+        application.add_handler(CommandHandler("cachestats", cachestats_command))
+        
+        # Register callback query handler for button callbacks
+        application.add_handler(CallbackQueryHandler(button_callback))
+        
+        # Register inline query handler for sharing tracks into other chats
+        application.add_handler(InlineQueryHandler(inline_query))
+        application.add_handler(ChosenInlineResultHandler(chosen_inline_result))
+        
+        # Register message handler for URLs
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_url))
+        
+        # Register error handler
+        application.add_error_handler(error_handler)
     
     # Create download directory if it doesn't exist
     os.makedirs(DOWNLOAD_DIRECTORY, exist_ok=True)
+    report_startup()
     
     # For production deployment on Render:
     PORT = int(os.environ.get('PORT', 8080))
     WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+    allowed_updates = ["message", "callback_query", "inline_query", "chosen_inline_result"]
     
-    # If webhook URL is provided, use webhooks, otherwise use polling
-    if WEBHOOK_URL:
-        await application.bot.set_webhook(url=f"{WEBHOOK_URL}/{API_TOKEN}")
+    # Stop on SIGTERM (sent by Render on redeploy) or Ctrl-C
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Not supported on Windows; Ctrl-C still interrupts the bot there
+            pass
+    
+    async with application:
         await application.start()
-        await application.update_webhook_info(
-            url=f"{WEBHOOK_URL}/{API_TOKEN}",
-            allowed_updates=["message", "callback_query"]
-        )
         
-        # Start the webhook server
-        from telegram.ext import Updater
-        updater = Updater(bot=application.bot)
-        updater.start_webhook(
-            listen="0.0.0.0",
-            port=PORT,
-            url_path=API_TOKEN
+        # If webhook URL is provided, use webhooks, otherwise use polling
+        if WEBHOOK_URL:
+            await application.updater.start_webhook(
+                listen="0.0.0.0",
+                port=PORT,
+                url_path=API_TOKEN,
+                webhook_url=f"{WEBHOOK_URL}/{API_TOKEN}",
+                allowed_updates=allowed_updates
+            )
+        else:
+            # Fallback to polling if no webhook URL is provided
+            await application.updater.start_polling(allowed_updates=allowed_updates)
+        
+        # Warm the file_id cache in the background during off-peak hours, if enabled
+        warmer = None
+        if BOT_MODE != 'frontend':
+            from bot.utils.cache_warmer import start_cache_warmer
+            warmer = start_cache_warmer(application.bot)
+        
+        # Run the bot until we are told to stop
+        await stop_event.wait()
+        
+        if warmer:
+            warmer.cancel()
+            await asyncio.gather(warmer, return_exceptions=True)
+        
+        # Keep receiving updates while draining, so users get the restart notice
+        # and can still cancel their downloads
+        print("Shutting down: no longer accepting new downloads")
+        stop_accepting()
+        interrupted = await drain(
+            DRAIN_TIMEOUT,
+            "⏸ The bot restarted before this download finished. Please send your request again."
         )
-    else:
-        # Fallback to polling if no webhook URL is provided
-        await application.run_polling()
+        print(f"Drain finished, {interrupted} download(s) interrupted")
+        
+        await application.updater.stop()
+        await application.stop()
     
-    # Run the bot until you press Ctrl-C
-    await application.idle()
+    await close_client()
 
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from telegram.ext import ApplicationBuilder
+import bot.utils.botapi as botapi
+
+class StubBotAPI(BaseHTTPRequestHandler):
+    """Stands in for a local telegram-bot-api server and records what it receives."""
+
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        method = self.path.rsplit('/', 1)[1]
+        StubBotAPI.requests.append((method, self.headers.get('Content-Type', ''), body))
+        if method == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "stub", "username": "stub_bot"}
+        else:
+            result = {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": 1, "type": "private"},
+                "audio": {"file_id": "stub-file-id", "file_unique_id": "stub", "duration": 1}
+            }
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def test_send_audio_by_path_to_local_server(tmp_path, monkeypatch):
+    """In local mode sendAudio hands the server a file:// path instead of uploading the file."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(botapi, 'BOT_API_BASE_URL', f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(botapi, 'LOCAL_BOT_API', True)
+    StubBotAPI.requests = []
+    audio_path = tmp_path / 'track.mp3'
+    audio_path.write_bytes(b'\0' * 1024)
+
+    async def send():
+        application = botapi.configure_builder(ApplicationBuilder().token('123:stub')).build()
+        async with application:
+            with botapi.upload_file(str(audio_path)) as audio:
+                message = await application.bot.send_audio(chat_id=1, audio=audio)
+        return message
+
+    try:
+        message = asyncio.run(send())
+    finally:
+        server.shutdown()
+
+    assert message.audio.file_id == 'stub-file-id'
+    send_audio = [request for request in StubBotAPI.requests if request[0] == 'sendAudio']
+    assert len(send_audio) == 1
+    _, content_type, body = send_audio[0]
+    # Plain form fields, no multipart upload of the file's bytes
+    assert content_type == 'application/x-www-form-urlencoded'
+    params = parse_qs(body.decode())
+    assert params['audio'] == [audio_path.absolute().as_uri()]
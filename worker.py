@@ -0,0 +1,135 @@
+import time
+_IMPORT_START = time.perf_counter()
+
+import asyncio
+import importlib
+import os
+import signal
+import socket
+from dotenv import load_dotenv
+
+# Load environment variables from .env file (before bot.config reads them)
+load_dotenv()
+
+from telegram import Bot, Message
+from bot.config import (API_TOKEN, DOWNLOAD_DIRECTORY, DRAIN_TIMEOUT, JOB_HEARTBEAT_INTERVAL,
+                        JOB_LEASE_SECONDS, WORKER_CONCURRENCY, WORKER_POLL_INTERVAL)
+from bot.utils.botapi import bot_api_settings
+from bot.utils.broker import check_shared_broker, get_broker
+from bot.utils.cache_warmer import start_cache_warmer
+from bot.utils.http import close_client
+from bot.utils.jobs import cancel_job, drain, stop_accepting
+from bot.utils.tracing import log, trace
+from bot.utils.startup import record_phase, report_startup, start_tool_probe
+
+record_phase('imports', _IMPORT_START)
+
+# Job kind -> (module, coroutine) that runs it; each takes the originating message first
+JOB_RUNNERS = {
+    'spotify_track': ('bot.handlers.spotify', 'download_single_track'),
+    'youtube_audio': ('bot.handlers.youtube', 'download_youtube_audio'),
+}
+
+async def run_job(bot, broker, worker_id, job):
+    """Run one leased job, renewing its lease until the download finishes."""
+    # Continue the trace of the update that enqueued the job
+    with trace('job', trace_id=job['payload'].get('trace_id'), kind=job['kind'], attempt=job['attempts']):
+        await _run_job(bot, broker, worker_id, job)
+
+async def _run_job(bot, broker, worker_id, job):
+    if job['kind'] not in JOB_RUNNERS:
+        await asyncio.to_thread(broker.fail, job['id'], worker_id, f"Unknown job kind: {job['kind']}")
+        return
+    module_name, function_name = JOB_RUNNERS[job['kind']]
+    runner = getattr(importlib.import_module(module_name), function_name)
+    message = Message.de_json(job['payload']['message'], bot)
+    job_id = job['payload']['params']['job_id']
+    log(f"Worker {worker_id} running job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+
+    task = asyncio.create_task(runner(message, **job['payload']['params']))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=JOB_HEARTBEAT_INTERVAL)
+        if done:
+            break
+        owned = await asyncio.to_thread(broker.heartbeat, job['id'], worker_id, JOB_LEASE_SECONDS)
+        if not owned:
+            if await asyncio.to_thread(broker.status, job['id']) == 'cancelled':
+                # The user pressed Cancel on the front-end
+                log(f"Job {job['id']} cancelled by the user")
+                cancelled = cancel_job(job_id)
+            else:
+                # Our lease expired and the job went to another worker, so stop duplicating it
+                log(f"Worker {worker_id} lost the lease on job {job['id']}, cancelling")
+                cancelled = cancel_job(job_id, notice=None)
+            if not cancelled:
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return
+
+    if task.cancelled():
+        # Interrupted by shutdown: put the job back so another worker picks it up
+        log(f"Job {job['id']} interrupted, returning it to the queue")
+        await asyncio.to_thread(broker.release, job['id'], worker_id)
+        return
+    try:
+        task.result()
+    except Exception as e:
+        log(f"Job {job['id']} failed: {e}")
+        await asyncio.to_thread(broker.fail, job['id'], worker_id, str(e))
+    else:
+        await asyncio.to_thread(broker.complete, job['id'], worker_id)
+
+async def main() -> None:
+    """Pull download jobs from the broker and run them until SIGTERM."""
+    check_shared_broker()
+    start_tool_probe()
+    os.makedirs(DOWNLOAD_DIRECTORY, exist_ok=True)
+    broker = get_broker()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    running = set()
+    report_startup()
+    print(f"Worker {worker_id} started with {WORKER_CONCURRENCY} slots")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Not supported on Windows; Ctrl-C still interrupts the worker there
+            pass
+
+    async with Bot(API_TOKEN, **bot_api_settings()) as bot:
+        # Warm the file_id cache in the background during off-peak hours, if enabled
+        warmer = start_cache_warmer(bot)
+        while not stop_event.is_set():
+            job = None
+            if len(running) < WORKER_CONCURRENCY:
+                job = await asyncio.to_thread(broker.claim, worker_id, JOB_LEASE_SECONDS)
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=WORKER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(run_job(bot, broker, worker_id, job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+        # Stop claiming, let running jobs finish, and re-queue the ones that don't make it
+        print(f"Worker {worker_id} shutting down")
+        if warmer:
+            warmer.cancel()
+            await asyncio.gather(warmer, return_exceptions=True)
+        stop_accepting()
+        interrupted = await drain(
+            DRAIN_TIMEOUT,
+            "⏸ Interrupted by a restart, your download will resume shortly."
+        )
+        await asyncio.gather(*running, return_exceptions=True)
+        print(f"Worker {worker_id} stopped, {interrupted} job(s) returned to the queue")
+
+    await close_client()
+
+if __name__ == '__main__':
+    asyncio.run(main())
\ No newline at end of file